@@ -20,7 +20,7 @@ from telegram.ext import (
     filters
 )
 
-from storage import is_user_activated, activate_user, get_user_info
+from storage import is_user_activated, try_activate, get_user_info, ActivationResult
 from github_client import GitHubClient, format_alerts_report
 
 
@@ -66,38 +66,34 @@ async def activate_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     chat_id = update.effective_chat.id
     user = update.effective_user
 
-    if is_user_activated(chat_id):
+    token = context.args[0] if context.args and len(context.args) == 1 else None
+    username = user.username or user.first_name
+    result = try_activate(chat_id, username, token, ACTIVATION_TOKEN)
+
+    if result is ActivationResult.ALREADY:
         await update.message.reply_text("✅ Вы уже активированы!")
         return
 
-    if not context.args or len(context.args) != 1:
+    if token is None:
         await update.message.reply_text(
             "❌ Использование: `/activate <токен>`",
             parse_mode="Markdown"
         )
         return
 
-    token = context.args[0]
-
-    if token != ACTIVATION_TOKEN:
+    if result is ActivationResult.BAD_TOKEN:
         logger.warning(f"Failed activation attempt from {user.username} (chat_id: {chat_id})")
         await update.message.reply_text("❌ Неверный токен активации.")
         return
 
-    username = user.username or user.first_name
-    is_new = activate_user(chat_id, username)
-
-    if is_new:
-        logger.info(f"User activated: {username} (chat_id: {chat_id})")
-        await update.message.reply_text(
-            "✅ Активация успешна!\n\n"
-            "Теперь вы будете получать ежедневные отчёты о безопасности.\n\n"
-            "Доступные команды:\n"
-            "• /status - статус активации\n"
-            "• /update - проверить уязвимости прямо сейчас"
-        )
-    else:
-        await update.message.reply_text("✅ Вы уже были активированы ранее.")
+    logger.info(f"User activated: {username} (chat_id: {chat_id})")
+    await update.message.reply_text(
+        "✅ Активация успешна!\n\n"
+        "Теперь вы будете получать ежедневные отчёты о безопасности.\n\n"
+        "Доступные команды:\n"
+        "• /status - статус активации\n"
+        "• /update - проверить уязвимости прямо сейчас"
+    )
 
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -139,8 +135,8 @@ async def update_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text("🔍 Проверяю репозитории на уязвимости...")
 
     try:
-        client = GitHubClient(GITHUB_TOKEN)
-        alerts = client.get_all_alerts()
+        client: GitHubClient = context.bot_data["github_client"]
+        alerts = await client.get_all_alerts()
         report = format_alerts_report(alerts)
 
         await update.message.reply_text(
@@ -168,6 +164,11 @@ async def unknown_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
+async def post_shutdown(application: Application) -> None:
+    """Закрыть HTTP клиент GitHub при остановке бота."""
+    await application.bot_data["github_client"].close()
+
+
 def main() -> None:
     """Запуск бота."""
     if not TELEGRAM_BOT_TOKEN:
@@ -177,7 +178,18 @@ def main() -> None:
     if not GITHUB_TOKEN:
         raise ValueError("GITHUB_TOKEN not set in environment")
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Обрабатываем апдейты параллельно: долгий /update одного пользователя
+        # не задерживает ответы остальным
+        .concurrent_updates(True)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Один клиент на весь процесс: соединения с GitHub переиспользуются
+    application.bot_data["github_client"] = GitHubClient(GITHUB_TOKEN)
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("activate", activate_command))
@@ -2,26 +2,97 @@
 GitHub API клиент для получения Dependabot Security Alerts.
 """
 
+import io
 import os
-import requests
-from typing import List, Dict, Any
+import time
+import asyncio
+import httpx
+import orjson
+from typing import List, Dict, Any, Tuple
 from dataclasses import dataclass
-from enum import Enum
+from enum import IntEnum
+
+
+# Все репозитории пользователя вместе с открытыми alerts, по 100 репозиториев за запрос
+ALERTS_QUERY = """
+query($cursor: String) {
+  viewer {
+    repositories(
+      first: 100
+      after: $cursor
+      affiliations: [OWNER, COLLABORATOR, ORGANIZATION_MEMBER]
+      ownerAffiliations: [OWNER, COLLABORATOR, ORGANIZATION_MEMBER]
+    ) {
+      pageInfo {
+        endCursor
+        hasNextPage
+      }
+      nodes {
+        nameWithOwner
+        url
+        isArchived
+        isDisabled
+        viewerPermission
+        vulnerabilityAlerts(first: 100, states: OPEN) {
+          nodes {
+            number
+            createdAt
+            securityAdvisory {
+              severity
+              ghsaId
+              summary
+              identifiers {
+                type
+                value
+              }
+            }
+            securityVulnerability {
+              package {
+                name
+              }
+              vulnerableVersionRange
+              firstPatchedVersion {
+                identifier
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+# Telegram отклоняет сообщения длиннее 4096 символов, оставляем запас под футер
+REPORT_MAX_LENGTH = 3800
+
 
+class Severity(IntEnum):
+    """Критичность alert, значение - индекс корзины в результате get_all_alerts."""
+    CRITICAL = 0
+    HIGH = 1
+    MODERATE = 2
+    LOW = 3
 
-class Severity(Enum):
-    CRITICAL = "critical"
-    HIGH = "high"
-    MODERATE = "moderate"
-    LOW = "low"
 
+# Значения enum SecurityAdvisorySeverity из GraphQL совпадают с именами Severity
+SEVERITY_BY_NAME = {severity.name: severity for severity in Severity}
 
-@dataclass
+# Неизменяемые части отчёта, _SEV_* индексируются по Severity
+_SEV_EMOJI = ("🔴", "🟠", "🟡", "🔵")
+_SEV_NAME = tuple(severity.name for severity in Severity)
+_SEP = "─" * 25
+_REPORT_EMPTY = "✅ *Security Monitor Report*\n\nНет открытых уязвимостей! Все репозитории в безопасности."
+_REPORT_FOOTER = "\n\n💡 *Рекомендация:* Обновите зависимости командой `npm update` или `pip install --upgrade`"
+
+
+@dataclass(slots=True, frozen=True)
 class SecurityAlert:
     """Представление security alert."""
     repo_name: str
     package_name: str
-    severity: str
+    severity: Severity
     cve_id: str
     ghsa_id: str
     summary: str
@@ -35,6 +106,19 @@ class GitHubClient:
     """Клиент для работы с GitHub API."""
 
     BASE_URL = "https://api.github.com"
+    GRAPHQL_URL = f"{BASE_URL}/graphql"
+    CONNECTION_LIMIT = 20
+    REQUEST_TIMEOUT = 30
+    # Сколько секунд переиспользовать результат get_all_alerts
+    ALERTS_CACHE_TTL = 60
+    # Повторы при rate limit: не больше MAX_RETRIES, суммарное ожидание не дольше MAX_RETRY_WAIT
+    MAX_RETRIES = 3
+    MAX_RETRY_WAIT = 60
+
+    # token -> (time.monotonic() момента получения, alerts)
+    _alerts_cache: Dict[str, Tuple[float, List[List["SecurityAlert"]]]] = {}
+    # token -> идущий обход, к нему присоединяются параллельные вызовы
+    _alerts_inflight: Dict[str, "asyncio.Task[List[List[SecurityAlert]]]"] = {}
 
     def __init__(self, token: str):
         self.token = token
@@ -43,165 +127,256 @@ class GitHubClient:
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28"
         }
+        self._client: httpx.AsyncClient | None = None
 
-    def get_user_repos(self) -> List[Dict[str, Any]]:
-        """Получить все репозитории пользователя."""
-        repos = []
-        page = 1
+    async def __aenter__(self) -> "GitHubClient":
+        return self
 
-        while True:
-            response = requests.get(
-                f"{self.BASE_URL}/user/repos",
-                headers=self.headers,
-                params={
-                    "per_page": 100,
-                    "page": page,
-                    "type": "all"  # owner, collaborator, organization_member
-                }
-            )
-            response.raise_for_status()
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
 
-            data = response.json()
-            if not data:
-                break
-
-            repos.extend(data)
-            page += 1
-
-        return repos
-
-    def get_dependabot_alerts(self, owner: str, repo: str) -> List[SecurityAlert]:
-        """Получить Dependabot alerts для репозитория."""
-        alerts = []
-
-        try:
-            response = requests.get(
-                f"{self.BASE_URL}/repos/{owner}/{repo}/dependabot/alerts",
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Получить HTTP/2 клиент, создав его при первом обращении.
+        Клиент переиспользуется между вызовами, чтобы не открывать
+        новое TCP+TLS соединение на каждый запрос.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
                 headers=self.headers,
-                params={
-                    "state": "open",
-                    "per_page": 100
-                }
+                timeout=self.REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.CONNECTION_LIMIT)
             )
+        return self._client
 
-            # 403 = Dependabot alerts отключены для репозитория
-            # 404 = Нет доступа
-            if response.status_code in (403, 404):
-                return []
-
-            response.raise_for_status()
-            data = response.json()
+    async def close(self) -> None:
+        """Закрыть HTTP клиент."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
 
-            for alert in data:
-                security_advisory = alert.get("security_advisory") or {}
-                vulnerability = alert.get("security_vulnerability") or {}
-
-                # first_patched_version может быть None
-                first_patched = vulnerability.get("first_patched_version")
-                patched_version = first_patched.get("identifier") if first_patched else "N/A"
+    @staticmethod
+    def _rate_limit_delay(response: httpx.Response, attempt: int) -> float | None:
+        """
+        Сколько секунд ждать перед повтором запроса, упёршегося в rate limit.
+        None - ответ не связан с rate limit, повторять не нужно.
+        """
+        limited = response.status_code in (403, 429) or (
+            # Исчерпанный лимит GraphQL приходит как 200 с ошибкой RATE_LIMITED
+            response.status_code == 200 and b'"RATE_LIMITED"' in response.content
+        )
+        if not limited:
+            return None
+
+        # Экспоненциальная задержка как нижняя граница ожидания
+        backoff = 2 ** attempt
+
+        retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            return max(float(retry_after), backoff)
+
+        if response.headers.get("x-ratelimit-remaining") == "0":
+            reset = int(response.headers.get("x-ratelimit-reset", 0))
+            return max(reset - time.time() + 1, backoff)
+
+        # Secondary rate limit (403/429) или RATE_LIMITED без заголовков:
+        # GitHub советует ждать не меньше минуты. Ошибки доступа к отдельным
+        # репозиториям приходят в GraphQL как 200 с FORBIDDEN, а не как 403
+        return max(60, backoff)
+
+    async def _post(self, url: str, json: Dict[str, Any]) -> httpx.Response:
+        """
+        POST-запрос с учётом rate limit GitHub.
+        Retry-After и x-ratelimit-reset соблюдаются, запрос повторяется
+        не более MAX_RETRIES раз. Если лимит не снялся за MAX_RETRY_WAIT
+        секунд суммарного ожидания, выбрасывается RuntimeError.
+        """
+        slept = 0.0
 
-                # package тоже может быть None
-                package = vulnerability.get("package") or {}
+        for attempt in range(self.MAX_RETRIES + 1):
+            response = await self._get_client().post(url, json=json)
 
-                alerts.append(SecurityAlert(
-                    repo_name=f"{owner}/{repo}",
-                    package_name=package.get("name", "unknown"),
-                    severity=security_advisory.get("severity", "unknown"),
-                    cve_id=security_advisory.get("cve_id") or "",
-                    ghsa_id=security_advisory.get("ghsa_id") or "",
-                    summary=security_advisory.get("summary", "No description"),
-                    vulnerable_version=vulnerability.get("vulnerable_version_range", ""),
-                    patched_version=patched_version,
-                    url=alert.get("html_url", ""),
-                    created_at=alert.get("created_at", "")
-                ))
+            delay = self._rate_limit_delay(response, attempt)
+            if delay is None:
+                return response
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching alerts for {owner}/{repo}: {e}")
+            if attempt == self.MAX_RETRIES or slept + delay > self.MAX_RETRY_WAIT:
+                raise RuntimeError(f"GitHub rate limit exceeded, retry in {int(delay)} s")
 
-        return alerts
+            print(f"GitHub rate limit hit, retrying in {delay:.0f} s")
+            await asyncio.sleep(delay)
+            slept += delay
 
-    def get_all_alerts(self) -> Dict[str, List[SecurityAlert]]:
+    async def _graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Выполнить GraphQL-запрос и вернуть поле data.
+        Ошибки доступа к отдельным репозиториям (FORBIDDEN/NOT_FOUND)
+        не прерывают запрос: для них GitHub возвращает null.
+        """
+        response = await self._post(
+            self.GRAPHQL_URL,
+            json={"query": query, "variables": variables}
+        )
+        response.raise_for_status()
+        payload = orjson.loads(response.content)
+
+        data = payload.get("data")
+        errors = payload.get("errors") or []
+
+        if not data:
+            messages = "; ".join(e.get("message", "unknown") for e in errors)
+            raise RuntimeError(f"GitHub GraphQL error: {messages or 'empty response'}")
+
+        for error in errors:
+            if error.get("type") not in ("FORBIDDEN", "NOT_FOUND"):
+                print(f"GitHub GraphQL error: {error.get('message')}")
+
+        return data
+
+    @staticmethod
+    def _parse_alert(repo: Dict[str, Any], alert: Dict[str, Any]) -> SecurityAlert:
+        """Преобразовать узел vulnerabilityAlerts в SecurityAlert."""
+        security_advisory = alert.get("securityAdvisory") or {}
+        vulnerability = alert.get("securityVulnerability") or {}
+
+        # firstPatchedVersion может быть None
+        first_patched = vulnerability.get("firstPatchedVersion")
+        patched_version = first_patched.get("identifier") if first_patched else "N/A"
+
+        # package тоже может быть None
+        package = vulnerability.get("package") or {}
+
+        cve_id = next(
+            (i["value"] for i in security_advisory.get("identifiers") or [] if i.get("type") == "CVE"),
+            ""
+        )
+
+        return SecurityAlert(
+            repo_name=repo["nameWithOwner"],
+            package_name=package.get("name", "unknown"),
+            # Неизвестная критичность считается LOW
+            severity=SEVERITY_BY_NAME.get(security_advisory.get("severity"), Severity.LOW),
+            cve_id=cve_id,
+            ghsa_id=security_advisory.get("ghsaId") or "",
+            summary=security_advisory.get("summary", "No description"),
+            vulnerable_version=vulnerability.get("vulnerableVersionRange", ""),
+            patched_version=patched_version,
+            url=f"{repo['url']}/security/dependabot/{alert['number']}",
+            created_at=alert.get("createdAt", "")
+        )
+
+    async def get_all_alerts(self, force: bool = False) -> List[List[SecurityAlert]]:
         """
         Получить все alerts для всех репозиториев пользователя.
-        Возвращает словарь сгруппированный по severity.
+        Репозитории и их alerts запрашиваются одним GraphQL-запросом
+        на каждые 100 репозиториев.
+        Результат кэшируется на ALERTS_CACHE_TTL секунд, force=True
+        игнорирует кэш. Параллельные вызовы ждут один общий обход.
+        Возвращает списки alerts, индексированные по Severity.
         """
-        all_alerts = {
-            "critical": [],
-            "high": [],
-            "moderate": [],
-            "low": []
-        }
+        cached = self._alerts_cache.get(self.token)
+        if not force and cached and time.monotonic() - cached[0] < self.ALERTS_CACHE_TTL:
+            return cached[1]
 
-        repos = self.get_user_repos()
+        token = self.token
+        task = self._alerts_inflight.get(token)
 
-        for repo in repos:
-            owner = repo["owner"]["login"]
-            repo_name = repo["name"]
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_all_alerts())
+            self._alerts_inflight[token] = task
 
-            alerts = self.get_dependabot_alerts(owner, repo_name)
+            def forget(done: asyncio.Task) -> None:
+                if self._alerts_inflight.get(token) is done:
+                    del self._alerts_inflight[token]
 
-            for alert in alerts:
-                severity = alert.severity.lower()
-                if severity in all_alerts:
-                    all_alerts[severity].append(alert)
-                else:
-                    all_alerts["low"].append(alert)
+            task.add_done_callback(forget)
+
+        # shield: отмена одного вызывающего не должна прерывать обход для остальных
+        return await asyncio.shield(task)
+
+    async def _fetch_all_alerts(self) -> List[List[SecurityAlert]]:
+        """Обойти все репозитории и сохранить результат в кэш."""
+        buckets: List[List[SecurityAlert]] = [[] for _ in Severity]
+        cursor = None
+
+        while True:
+            data = await self._graphql(ALERTS_QUERY, {"cursor": cursor})
+            repositories = data["viewer"]["repositories"]
+
+            for repo in repositories["nodes"] or []:
+                # Архивные и отключённые репозитории, а также репозитории без прав
+                # admin (нужны для чтения Dependabot alerts) не проверяем
+                if (
+                    not repo
+                    or repo.get("isArchived")
+                    or repo.get("isDisabled")
+                    or repo.get("viewerPermission") != "ADMIN"
+                ):
+                    continue
+
+                vulnerability_alerts = repo.get("vulnerabilityAlerts") or {}
+
+                for node in vulnerability_alerts.get("nodes") or []:
+                    alert = self._parse_alert(repo, node)
+                    buckets[alert.severity].append(alert)
+
+            page_info = repositories["pageInfo"]
+            if not page_info["hasNextPage"]:
+                break
+            cursor = page_info["endCursor"]
 
-        return all_alerts
+        self._alerts_cache[self.token] = (time.monotonic(), buckets)
+        return buckets
 
 
-def format_alerts_report(alerts: Dict[str, List[SecurityAlert]]) -> str:
+def format_alerts_report(alerts: List[List[SecurityAlert]]) -> str:
     """Форматировать отчёт об уязвимостях для Telegram."""
-    total = sum(len(a) for a in alerts.values())
+    total = sum(len(a) for a in alerts)
 
     if total == 0:
-        return "✅ *Security Monitor Report*\n\nНет открытых уязвимостей! Все репозитории в безопасности."
-
-    lines = [
-        "🛡️ *Security Monitor Report*",
-        f"📅 Найдено уязвимостей: *{total}*",
-        ""
-    ]
-
-    severity_emoji = {
-        "critical": "🔴",
-        "high": "🟠",
-        "moderate": "🟡",
-        "low": "🔵"
-    }
+        return _REPORT_EMPTY
 
-    severity_names = {
-        "critical": "CRITICAL",
-        "high": "HIGH",
-        "moderate": "MODERATE",
-        "low": "LOW"
-    }
+    buf = io.StringIO()
+    buf.write(f"🛡️ *Security Monitor Report*\n📅 Найдено уязвимостей: *{total}*\n")
+
+    truncated = False
 
-    for severity in ["critical", "high", "moderate", "low"]:
-        severity_alerts = alerts.get(severity, [])
+    for index, severity_alerts in enumerate(alerts):
         if not severity_alerts:
             continue
 
-        emoji = severity_emoji.get(severity, "⚪")
-        name = severity_names.get(severity, severity.upper())
+        header = f"\n\n{_SEV_EMOJI[index]} *{_SEV_NAME[index]}* ({len(severity_alerts)})\n{_SEP}"
 
-        lines.append(f"\n{emoji} *{name}* ({len(severity_alerts)})")
-        lines.append("─" * 25)
-
-        for alert in severity_alerts[:10]:  # Ограничим вывод
+        for position, alert in enumerate(severity_alerts[:10]):  # Ограничим вывод
             cve = alert.cve_id or alert.ghsa_id or "N/A"
-            lines.append(f"📦 `{alert.package_name}`")
-            lines.append(f"   📁 {alert.repo_name}")
-            lines.append(f"   🆔 {cve}")
-            lines.append(f"   ⬆️ Обновить до: {alert.patched_version}")
-            if alert.url:
-                lines.append(f"   🔗 [Подробнее]({alert.url})")
-            lines.append("")
+            link = f"\n   🔗 [Подробнее]({alert.url})" if alert.url else ""
+            block = (
+                f"\n📦 `{alert.package_name}`"
+                f"\n   📁 {alert.repo_name}"
+                f"\n   🆔 {cve}"
+                f"\n   ⬆️ Обновить до: {alert.patched_version}{link}\n"
+            )
+
+            # Заголовок пишется только вместе с первым alert, чтобы не оставить пустую секцию
+            if position == 0:
+                block = header + block
+
+            if buf.tell() + len(block) > REPORT_MAX_LENGTH:
+                truncated = True
+                break
+
+            buf.write(block)
+
+        if truncated:
+            # После alert уже есть перевод строки, после "... и ещё N" - нет
+            separator = "\n" if buf.getvalue().endswith("\n") else "\n\n"
+            buf.write(f"{separator}... остальные уязвимости не поместились в сообщение")
+            break
 
         if len(severity_alerts) > 10:
-            lines.append(f"   ... и ещё {len(severity_alerts) - 10}")
+            buf.write(f"\n   ... и ещё {len(severity_alerts) - 10}")
 
-    lines.append("\n💡 *Рекомендация:* Обновите зависимости командой `npm update` или `pip install --upgrade`")
+    buf.write(_REPORT_FOOTER)
 
-    return "\n".join(lines)
+    return buf.getvalue()
@@ -5,10 +5,14 @@
 """
 
 import os
+import time
 import asyncio
 import logging
+from collections import Counter
 from dotenv import load_dotenv
 from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 
 from storage import get_all_activated_chat_ids
 from github_client import GitHubClient, format_alerts_report
@@ -25,6 +29,33 @@ logger = logging.getLogger(__name__)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
+# Telegram ограничивает бота ~30 сообщениями в секунду
+SEND_RATE = 25
+# Одновременно открытых запросов к Telegram
+SEND_CONCURRENCY = 25
+SEND_ATTEMPTS = 3
+
+
+class SendPacer:
+    """Равномерно распределяет отправки: не чаще rate сообщений в секунду."""
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Дождаться своего слота для отправки."""
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float) -> None:
+        """Сдвинуть все следующие отправки, например после RetryAfter."""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
 
 async def send_daily_report() -> None:
     """Отправить ежедневный отчёт всем активированным пользователям."""
@@ -41,26 +72,52 @@ async def send_daily_report() -> None:
     logger.info(f"Sending daily report to {len(chat_ids)} users")
 
     try:
-        client = GitHubClient(GITHUB_TOKEN)
-        alerts = client.get_all_alerts()
+        async with GitHubClient(GITHUB_TOKEN) as client:
+            alerts = await client.get_all_alerts()
         report = format_alerts_report(alerts)
 
-        total_alerts = sum(len(a) for a in alerts.values())
+        total_alerts = sum(len(a) for a in alerts)
         logger.info(f"Found {total_alerts} total alerts")
 
-        bot = Bot(token=TELEGRAM_BOT_TOKEN)
-
-        for chat_id in chat_ids:
-            try:
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=report,
-                    parse_mode="Markdown",
-                    disable_web_page_preview=True
-                )
-                logger.info(f"Report sent to {chat_id}")
-            except Exception as e:
-                logger.error(f"Failed to send to {chat_id}: {e}")
+        # У отдельного Bot пул по умолчанию из одного соединения,
+        # параллельная отправка упиралась бы в него
+        bot = Bot(
+            token=TELEGRAM_BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=SEND_CONCURRENCY)
+        )
+        pacer = SendPacer(SEND_RATE)
+        semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+        errors = Counter()
+
+        async def send(chat_id: int) -> None:
+            for attempt in range(1, SEND_ATTEMPTS + 1):
+                await pacer.wait()
+                try:
+                    async with semaphore:
+                        await bot.send_message(
+                            chat_id=chat_id,
+                            text=report,
+                            parse_mode="Markdown",
+                            disable_web_page_preview=True
+                        )
+                    logger.info(f"Report sent to {chat_id}")
+                    return
+                except RetryAfter as e:
+                    if attempt == SEND_ATTEMPTS:
+                        logger.error(f"Failed to send to {chat_id}: {e}")
+                        errors[type(e).__name__] += 1
+                        return
+                    # Лимит общий для бота: притормаживаем все отправки, а не только эту
+                    pacer.pause(e.retry_after)
+                except Exception as e:
+                    logger.error(f"Failed to send to {chat_id}: {e}")
+                    errors[type(e).__name__] += 1
+                    return
+
+        await asyncio.gather(*[send(chat_id) for chat_id in chat_ids])
+
+        if errors:
+            logger.warning(f"Failed to send {sum(errors.values())} reports: {dict(errors)}")
 
     except Exception as e:
         logger.error(f"Error generating report: {e}")
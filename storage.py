@@ -1,40 +1,121 @@
 """
 Хранилище активированных пользователей.
-Сохраняет chat_id в JSON файл.
+Сохраняет chat_id в SQLite базу.
 """
 
-import json
-import os
+import logging
+import sqlite3
+import threading
+import orjson
+from enum import Enum
 from pathlib import Path
 from typing import Set
 from datetime import datetime
 
 
-STORAGE_FILE = Path(__file__).parent / "activated_users.json"
+DB_FILE = Path(__file__).parent / "activated_users.db"
+# Старое JSON-хранилище, переносится в базу при первом открытии
+LEGACY_STORAGE_FILE = Path(__file__).parent / "activated_users.json"
 
+logger = logging.getLogger(__name__)
 
-def load_users() -> dict:
-    """Загрузить данные о пользователях из файла."""
-    if not STORAGE_FILE.exists():
-        return {"users": {}}
+
+class ActivationResult(Enum):
+    OK = "ok"
+    ALREADY = "already"
+    BAD_TOKEN = "bad_token"
+
+
+# Одно соединение на процесс, обращения к нему сериализуются блокировкой
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+
+
+def _migrate_legacy_json(conn: sqlite3.Connection) -> None:
+    """
+    Перенести пользователей из activated_users.json, если файл есть.
+    OSError пробрасывается: миграция не отмечается выполненной и будет
+    повторена. Повреждённый файл повтор не исправит, поэтому он
+    переименовывается в .corrupt (данные остаются на диске для ручного
+    восстановления), а миграция считается выполненной.
+    """
+    if not LEGACY_STORAGE_FILE.exists():
+        return
+
+    raw = LEGACY_STORAGE_FILE.read_bytes()
 
     try:
-        with open(STORAGE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return {"users": {}}
+        data = orjson.loads(raw)
+        rows = [
+            (int(chat_id), info.get("username"), info.get("activated_at"))
+            for chat_id, info in data.get("users", {}).items()
+        ]
+    except (ValueError, TypeError, AttributeError) as e:
+        corrupt_file = LEGACY_STORAGE_FILE.with_suffix(".json.corrupt")
+        LEGACY_STORAGE_FILE.rename(corrupt_file)
+        logger.error(f"Cannot migrate {LEGACY_STORAGE_FILE.name}: {e}. File moved to {corrupt_file.name}")
+        return
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (chat_id, username, activated_at) VALUES (?, ?, ?)",
+        rows
+    )
+
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Открыть базу при первом обращении и подготовить схему.
+    Вызывается под _lock.
+    """
+    global _conn
+
+    if _conn is None:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
 
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
 
-def save_users(data: dict) -> None:
-    """Сохранить данные о пользователях в файл."""
-    with open(STORAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS users ("
+                    "chat_id INTEGER PRIMARY KEY, "
+                    "username TEXT, "
+                    "activated_at TEXT)"
+                )
+                # user_version = 0 пока миграция не завершилась; при OSError
+                # транзакция откатывается и следующий вызов повторит её
+                if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                    _migrate_legacy_json(conn)
+                    conn.execute("PRAGMA user_version = 1")
+        except Exception:
+            conn.close()
+            raise
+
+        _conn = conn
+
+    return _conn
+
+
+def _insert_user(conn: sqlite3.Connection, chat_id: int, username: str | None) -> bool:
+    """
+    Добавить пользователя. Вызывается под _lock.
+    Возвращает False если пользователь уже был активирован.
+    """
+    with conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO users (chat_id, username, activated_at) VALUES (?, ?, ?)",
+            (chat_id, username, datetime.now().isoformat())
+        )
+    return cursor.rowcount == 1
 
 
 def is_user_activated(chat_id: int) -> bool:
     """Проверить, активирован ли пользователь."""
-    data = load_users()
-    return str(chat_id) in data.get("users", {})
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT 1 FROM users WHERE chat_id = ? LIMIT 1", (chat_id,)
+        ).fetchone()
+    return row is not None
 
 
 def activate_user(chat_id: int, username: str = None) -> bool:
@@ -42,32 +123,48 @@ def activate_user(chat_id: int, username: str = None) -> bool:
     Активировать пользователя.
     Возвращает True если это новая активация, False если уже был активирован.
     """
-    data = load_users()
+    with _lock:
+        return _insert_user(_get_connection(), chat_id, username)
 
-    if "users" not in data:
-        data["users"] = {}
 
-    chat_id_str = str(chat_id)
+def try_activate(
+    chat_id: int,
+    username: str | None,
+    token: str | None,
+    expected_token: str
+) -> ActivationResult:
+    """
+    Проверить токен и активировать пользователя за одно обращение к хранилищу.
+    Уже активированному пользователю токен не проверяется.
+    """
+    with _lock:
+        conn = _get_connection()
 
-    if chat_id_str in data["users"]:
-        return False
+        if conn.execute("SELECT 1 FROM users WHERE chat_id = ? LIMIT 1", (chat_id,)).fetchone():
+            return ActivationResult.ALREADY
 
-    data["users"][chat_id_str] = {
-        "username": username,
-        "activated_at": datetime.now().isoformat()
-    }
+        if token != expected_token:
+            return ActivationResult.BAD_TOKEN
 
-    save_users(data)
-    return True
+        _insert_user(conn, chat_id, username)
+        return ActivationResult.OK
 
 
 def get_all_activated_chat_ids() -> Set[int]:
     """Получить все активированные chat_id."""
-    data = load_users()
-    return {int(chat_id) for chat_id in data.get("users", {}).keys()}
+    with _lock:
+        rows = _get_connection().execute("SELECT chat_id FROM users").fetchall()
+    return {chat_id for (chat_id,) in rows}
 
 
 def get_user_info(chat_id: int) -> dict | None:
     """Получить информацию о пользователе."""
-    data = load_users()
-    return data.get("users", {}).get(str(chat_id))
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT username, activated_at FROM users WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    return {"username": row[0], "activated_at": row[1]}